@@ -1,28 +1,136 @@
 #!/usr/bin/env python
 
+import io
 import sys
+from bisect import bisect_left, bisect_right
 from utilities import calculate_overlap, calculate_stddev, get_most_common_item
 
 SV_TYPES = ['UNK', 'BND', 'DEL', 'INS', 'INV', 'NOT_SV']
+SV_TYPE_INDICES = {sv_type: i for i, sv_type in enumerate(SV_TYPES)}
+
+# Related SV types which are joined to a single type
+SV_TYPE_ALIASES = {
+    'DEL_ALU': 'DEL',
+    'DEL_LINE1': 'DEL',
+    'ALU': 'INS',
+    'LINE1': 'INS',
+    'SVA': 'INS',
+    'DUP': 'INS',
+    'CNV': 'INS',
+    'INVDUP': 'INS',
+    'INV': 'INS',
+    'TRA': 'BND',
+}
+
+# INFO keys read when parsing SVs
+INFO_KEYS = frozenset(['SVTYPE',
+                       'END',
+                       'SVLEN',
+                       'SVSIZE',
+                       'SVINSSEQ',
+                       'LEFT_SVINSSEQ',
+                       'RIGHT_SVINSSEQ',
+                       'NUM_MERGED_SVS',
+                       'STDDEV_POS'])
+END_BITS = 40  # Room for positions well beyond the largest --region-end (2^34 - 1)
+END_MASK = (1 << END_BITS) - 1
+
+
+def pack_begin_and_end(begin, end):
+    """
+    Packs a begin and end position into a single int, which is cheaper to store and hash than a tuple.
+    """
+    assert 0 <= end <= END_MASK
+    return (begin << END_BITS) | end
+
+
+# Unit tests for the function 'pack_begin_and_end()'
+assert pack_begin_and_end(0, 1) < pack_begin_and_end(1, 0)
+assert pack_begin_and_end(4294967000, 4294967400) >> END_BITS == 4294967000
+assert pack_begin_and_end(4294967000, 4294967400) & END_MASK == 4294967400
+assert pack_begin_and_end(17179869183, 17179869183) & END_MASK == 17179869183
+
+
+def has_close_begin_and_end(sorted_begins_and_ends, other_begin, other_end, max_sv_distance, max_size_difference):
+    """
+    Checks if any packed begin and end pair is close enough to another SV's begin and end for the two to merge. The
+    pairs must be sorted, which allows only visiting pairs with a begin within max_sv_distance of the other begin.
+    """
+    other_size = other_end - other_begin
+    lo = bisect_left(sorted_begins_and_ends, pack_begin_and_end(other_begin - max_sv_distance, 0))
+    hi = bisect_right(sorted_begins_and_ends, pack_begin_and_end(other_begin + max_sv_distance, END_MASK), lo)
 
-def make_info_dictionary(info):
-    spl_info = info.split(";")
+    for i in range(lo, hi):
+        begin_and_end = sorted_begins_and_ends[i]
+        begin = begin_and_end >> END_BITS
+        end = begin_and_end & END_MASK
+
+        # For other SVs, calculate their overlap. Bounds are compared directly instead of calling abs()
+        if -max_sv_distance <= end - other_end <= max_sv_distance and\
+                -max_size_difference <= other_size - (end - begin) <= max_size_difference:
+            return True  # Overlap is enough to merge
+
+    # We could not find any interval in this SV that overlaps enough, we should therefore not merge these two SVs
+    return False
+
+
+def extract_info_keys(info, keys):
+    """
+    Makes a dictionary of the INFO fields with a key in 'keys'. Flags (fields without "=") get an empty value.
+    """
     info_dict = {}
 
-    for key_val in spl_info:
-        if "=" in key_val:
-            key, val = key_val.split("=")
+    for key_val in info.split(";"):
+        key, _, val = key_val.partition("=")
+
+        if key in keys:
             info_dict[key] = val
-        else:
-            info_dict[key_val] = ""
 
     return info_dict
 
 
+def remove_info_keys(info, keys):
+    """
+    Removes all INFO fields with a key in 'keys'.
+    """
+    return ";".join(key_val for key_val in info.split(";") if key_val.partition("=")[0] not in keys)
+
+
+# Unit tests for the functions 'extract_info_keys()' and 'remove_info_keys()'
+assert extract_info_keys("", {"END"}) == {}
+assert extract_info_keys("SVTYPE=DEL;CIPOS=-5,5;END=300;IMPRECISE", {"SVTYPE", "END", "IMPRECISE"}) == \
+    {"SVTYPE": "DEL", "END": "300", "IMPRECISE": ""}
+assert extract_info_keys("A=1;B=x=y;A=2", {"A", "B"}) == {"A": "2", "B": "x=y"}
+assert remove_info_keys("SVTYPE=DEL;NUM_MERGED_SVS=2;EMPTY=;FLAG", ["NUM_MERGED_SVS"]) == "SVTYPE=DEL;EMPTY=;FLAG"
+assert remove_info_keys("SVTYPE=DEL;STDDEV_POS=1.00,2.00", ["STDDEV_POS"]) == "SVTYPE=DEL"
+assert remove_info_keys("STDDEV_POS=1.00,2.00", ["STDDEV_POS"]) == ""
+
+
 class SV(object):
     """
     Constructs a structural variant (SV) candidate
     """
+    __slots__ = ("is_outputting_ids",
+                 "join_mode",
+                 "is_sv",
+                 "check_type",
+                 "chromosome",
+                 "begin",
+                 "end",
+                 "ids",
+                 "old_num_merged_svs",
+                 "type",
+                 "min_begin",
+                 "max_begin",
+                 "min_end",
+                 "max_end",
+                 "begins",
+                 "ends",
+                 "infos",
+                 "sorted_begins_and_ends",
+                 "refs",
+                 "alts")
+
     def __init__(self,
                  vcf_record,
                  check_type = True,
@@ -34,9 +142,10 @@ class SV(object):
         self.join_mode = join_mode
         self.is_sv = True
 
-        spl_line = vcf_record.rstrip("\n").split("\t")[:8]
+        # Only the first eight columns are used, leave FORMAT and sample columns unsplit
+        spl_line = vcf_record.rstrip("\n").split("\t", 8)
         self.check_type = check_type
-        self.chromosome = spl_line[0]
+        self.chromosome = sys.intern(spl_line[0])
         self.begin = int(spl_line[1])
         self.end = self.begin
 
@@ -47,9 +156,32 @@ class SV(object):
         if spl_line[7] == ".":
             spl_line[7] = ""
 
-        info_dict = make_info_dictionary(spl_line[7])
+        # Small variants without an SVTYPE are never SVs, reject them before tokenizing INFO
+        if "SVTYPE" not in spl_line[7] and abs(len(spl_line[3]) - len(spl_line[4])) < 50:
+            self.is_sv = False
+            return None
 
-        if "SVTYPE" not in info_dict:
+        info_dict = extract_info_keys(spl_line[7], INFO_KEYS)
+
+        # Remove old values
+        self.old_num_merged_svs = -1
+        removed_keys = []
+
+        if not join_mode and "NUM_MERGED_SVS" in info_dict:
+            self.old_num_merged_svs = int(info_dict["NUM_MERGED_SVS"])
+            removed_keys.append("NUM_MERGED_SVS")
+
+        if "STDDEV_POS" in info_dict:
+            removed_keys.append("STDDEV_POS")
+
+        if removed_keys:
+            spl_line[7] = remove_info_keys(spl_line[7], removed_keys)
+
+        svtype = info_dict.get("SVTYPE")
+        svlen = info_dict.get("SVLEN")
+        svsize = info_dict.get("SVSIZE")
+
+        if svtype is None:
             ref = spl_line[3]
             alt = spl_line[4]
 
@@ -60,88 +192,63 @@ class SV(object):
                 if len(ref) >= len(alt) + 50:
                     spl_line[4] = alt_spl[0]
 
-                    if len(spl_line[7]) > 0:
-                        spl_line[7] += ";"
-
-                    spl_line[7] = "%sSVTYPE=DEL;SVLEN=%d" % (spl_line[7], len(alt) - len(ref))
-                    info_dict["SVTYPE"] = "DEL"
-                    info_dict["SVSIZE"] = "%d" % (len(ref) - len(alt))
-                    info_dict["SVLEN"] = "%d" % (len(alt) - len(ref))
+                    info_fields = [spl_line[7]] if len(spl_line[7]) > 0 else []
+                    info_fields.append(f"SVTYPE=DEL;SVLEN={len(alt) - len(ref)}")
+                    spl_line[7] = ";".join(info_fields)
+                    svtype = "DEL"
+                    svsize = len(ref) - len(alt)
+                    svlen = len(alt) - len(ref)
                 elif len(alt) >= len(ref) + 50:
                     spl_line[4] = alt_spl[0]
 
-                    if len(spl_line[7]) > 0:
-                        spl_line[7] += ";"
-
-                    spl_line[7] = "%sSVTYPE=INS;SVLEN=%d" % (spl_line[7], len(alt) - len(ref))
-                    info_dict["SVTYPE"] = "INS"
-                    info_dict["SVSIZE"] = "%d" % (len(alt) - len(ref))
-                    info_dict["SVLEN"] = "%d" % (len(alt) - len(ref))
+                    info_fields = [spl_line[7]] if len(spl_line[7]) > 0 else []
+                    info_fields.append(f"SVTYPE=INS;SVLEN={len(alt) - len(ref)}")
+                    spl_line[7] = ";".join(info_fields)
+                    svtype = "INS"
+                    svsize = len(alt) - len(ref)
+                    svlen = len(alt) - len(ref)
                 else:
                   self.is_sv = False
                   return None
             else:
               self.is_sv = False
               return None
-
-            if "SVTYPE" not in info_dict:
-                info_dict["SVTYPE"] = "NOT_SV"
-                self.is_sv = False
-                return None
         else:
-            if (ignore_bnd and (info_dict["SVTYPE"] == "BND" or info_dict["SVTYPE"] == "TRA")) or \
-               (ignore_inv and info_dict["SVTYPE"] == "INV"):
+            if (ignore_bnd and (svtype == "BND" or svtype == "TRA")) or \
+               (ignore_inv and svtype == "INV"):
                 self.is_sv = False
                 return None
 
             # Join related SV types
-            if info_dict["SVTYPE"] == "DEL_ALU" or info_dict["SVTYPE"] == "DEL_LINE1":
-                info_dict["SVTYPE"] = "DEL"
-            elif info_dict["SVTYPE"] == "ALU" or info_dict["SVTYPE"] == "LINE1" or info_dict["SVTYPE"] == "SVA" or \
-                 info_dict["SVTYPE"] == "DUP" or info_dict["SVTYPE"] == "CNV" or info_dict["SVTYPE"] == "INVDUP" or \
-                 info_dict["SVTYPE"] == "INV":
-                info_dict["SVTYPE"] = "INS"
-            elif info_dict["SVTYPE"] == "TRA":
-                info_dict["SVTYPE"] = "BND"
+            svtype = SV_TYPE_ALIASES.get(svtype, svtype)
 
+        if svtype == "DEL":
+            end = info_dict.get("END")
 
-
-        # Remove old values
-        self.old_num_merged_svs = -1
-
-        if not join_mode and "NUM_MERGED_SVS" in info_dict:
-          #print(int(info_dict["NUM_MERGED_SVS"]))
-          self.old_num_merged_svs = int(info_dict["NUM_MERGED_SVS"])
-          spl_line[7] = spl_line[7].replace("NUM_MERGED_SVS=%s;" % info_dict["NUM_MERGED_SVS"], "")
-
-        if "STDDEV_POS" in info_dict:
-          spl_line[7] = spl_line[7].replace("STDDEV_POS=%s;" % info_dict["STDDEV_POS"], "")
-
-        if "SVTYPE" in info_dict and info_dict["SVTYPE"] == "DEL":
-            if "END" in info_dict:
-                self.end = int(info_dict["END"])
+            if end is not None:
+                self.end = int(end)
             else:
-                if "SVSIZE" in info_dict:
-                    self.end = self.begin + abs(int(info_dict["SVSIZE"]))
-                elif "SVLEN" in info_dict:
-                    self.end = self.begin + abs(int(info_dict["SVLEN"]))
+                if svsize is not None:
+                    self.end = self.begin + abs(int(svsize))
+                elif svlen is not None:
+                    self.end = self.begin + abs(int(svlen))
 
             if self.end - 50 < self.begin:
                 self.is_sv = False
                 return None
-        elif "SVTYPE" in info_dict and info_dict["SVTYPE"] == "INS":
-            svlen = int(info_dict["SVLEN"]) if "SVLEN" in info_dict else -1
+        elif svtype == "INS":
+            svlen = int(svlen) if svlen is not None else -1
 
             if svlen == -1:
-                svlen = int(info_dict["SVSIZE"]) if "SVSIZE" in info_dict else -1
+                svlen = int(svsize) if svsize is not None else -1
 
             if svlen < 50 and "SVINSSEQ" not in info_dict and "LEFT_SVINSSEQ" not in info_dict and "RIGHT_SVINSSEQ" not in info_dict:
                 self.is_sv = False
                 return None
 
         if check_type:
-            if info_dict["SVTYPE"] in SV_TYPES:
-                self.type = SV_TYPES.index(info_dict["SVTYPE"])
+            if svtype in SV_TYPE_INDICES:
+                self.type = SV_TYPE_INDICES[svtype]
             else:
                 self.type = 0  # Unknown type
                 assert False
@@ -151,19 +258,21 @@ class SV(object):
         # Get all begins and ends
         self.min_begin = self.begin
         self.max_begin = self.begin
+        self.min_end = self.end
+        self.max_end = self.end
         self.begins = [self.begin]
         self.ends = [self.end]
         self.infos = [spl_line[7]]
-        self.unique_begins_and_ends = set()
-        self.unique_begins_and_ends.add((int(self.begin), int(self.end)))
+        # Unique begin and end pairs, kept sorted during merges
+        self.sorted_begins_and_ends = [pack_begin_and_end(self.begin, self.end)]
         self.refs = [spl_line[3]]
         self.alts = [spl_line[4]]
 
 
     """
-    Converts the SV to a string
+    Writes the SV as a VCF record to a file object
     """
-    def __str__(self):
+    def write_to(self, out):
         info = self.infos[0]
         if len(info) > 0:
             info += ";"
@@ -175,30 +284,23 @@ class SV(object):
         if self.old_num_merged_svs > 0:
             num_svs += self.old_num_merged_svs - 1
 
+        stddev_begins = calculate_stddev(self.begins)
+        stddev_ends = calculate_stddev(self.ends)
+
         if self.is_outputting_ids:
-            info += "MERGED_IDS=%s;NUM_%s_SVS=%d;STDDEV_POS=%.2f,%.2f" % (",".join(self.ids),
-                                                                          num_text,
-                                                                          num_svs,
-                                                                          calculate_stddev(self.begins),
-                                                                          calculate_stddev(self.ends)
-                                                                          )
-        else:
-            info += "NUM_%s_SVS=%d;STDDEV_POS=%.2f,%.2f" % (num_text,
-                                                            num_svs,
-                                                            calculate_stddev(self.begins),
-                                                            calculate_stddev(self.ends)
-                                                            )
-
-        return "%s\t%d\t%s\t%s\t%s\t%d\t%s\t%s\n" % (
-            self.chromosome,
-            self.begin,
-            ".",  # variant ID
-            self.refs[0],
-            self.alts[0],
-            0,  # quality
-            ".",  # filter
-            info
-            )
+            info += f"MERGED_IDS={','.join(self.ids)};"
+
+        # Columns ID, QUAL and FILTER are written as '.', 0 and '.'
+        out.write(f"{self.chromosome}\t{self.begin}\t.\t{self.refs[0]}\t{self.alts[0]}\t0\t.\t{info}"
+                  f"NUM_{num_text}_SVS={num_svs};STDDEV_POS={stddev_begins:.2f},{stddev_ends:.2f}\n")
+
+    """
+    Converts the SV to a string
+    """
+    def __str__(self):
+        out = io.StringIO()
+        self.write_to(out)
+        return out.getvalue()
 
 
     """
@@ -206,16 +308,16 @@ class SV(object):
     """
     def finalize(self):
         # Get the most common begin and end combo
-        begins_and_ends = list(zip(self.begins, self.ends))
-        self.begin, self.end = get_most_common_item(begins_and_ends)
+        begins_and_ends = list(map(pack_begin_and_end, self.begins, self.ends))
+        begin_and_end = get_most_common_item(begins_and_ends)
+        self.begin = begin_and_end >> END_BITS
+        self.end = begin_and_end & END_MASK
+        i = begins_and_ends.index(begin_and_end)
 
-        for i, (begin, end) in enumerate(begins_and_ends):
-            if begin == self.begin and end == self.end:
-                if i > 0:
-                    self.infos[0] = self.infos[i]
-                    self.refs[0] = self.refs[i]
-                    self.alts[0] = self.alts[i]
-                return
+        if i > 0:
+            self.infos[0] = self.infos[i]
+            self.refs[0] = self.refs[i]
+            self.alts[0] = self.alts[i]
 
     """
     Defines how to represent the SV (in printing)
@@ -242,15 +344,18 @@ class SV(object):
                 abs(other_sv.min_begin - self.max_begin) > 10000:
             return False
 
-        for begin, end in self.unique_begins_and_ends:
-            # For other SVs, calculate their overlap
-            if abs(begin - other_sv.begin) <= max_sv_distance and\
-                    abs(end - other_sv.end) <= max_sv_distance and\
-                    abs((other_sv.end - other_sv.begin) - (end - begin)) <= max_size_difference:
-                return True  # Overlap is enough to merge
+        # Skip the pairwise check when other SV's begin or end is too far from all begins or ends of this SV
+        if other_sv.begin > self.max_begin + max_sv_distance or\
+                other_sv.begin < self.min_begin - max_sv_distance or\
+                other_sv.end > self.max_end + max_sv_distance or\
+                other_sv.end < self.min_end - max_sv_distance:
+            return False
 
-        # We could not find any interval in this SV that did not enough, we should therefore merge these two SVs
-        return False
+        return has_close_begin_and_end(self.sorted_begins_and_ends,
+                                       other_sv.begin,
+                                       other_sv.end,
+                                       max_sv_distance,
+                                       max_size_difference)
 
     """
     Merges two SVs. Assumes that they should be merged, which can be checked with the 'should merge' function
@@ -264,12 +369,21 @@ class SV(object):
 
         self.min_begin = min(self.min_begin, other_sv.min_begin)
         self.max_begin = max(self.max_begin, other_sv.max_begin)
+        self.min_end = min(self.min_end, other_sv.min_end)
+        self.max_end = max(self.max_end, other_sv.max_end)
         self.begins += other_sv.begins
         self.ends += other_sv.ends
         self.infos += other_sv.infos
         self.refs += other_sv.refs
         self.alts += other_sv.alts
-        self.unique_begins_and_ends = self.unique_begins_and_ends.union(other_sv.unique_begins_and_ends)
+        # Insert only pairs that are new to this SV, keeping the list sorted
+        sorted_begins_and_ends = self.sorted_begins_and_ends
+
+        for begin_and_end in other_sv.sorted_begins_and_ends:
+            i = bisect_left(sorted_begins_and_ends, begin_and_end)
+
+            if i == len(sorted_begins_and_ends) or sorted_begins_and_ends[i] != begin_and_end:
+                sorted_begins_and_ends.insert(i, begin_and_end)
 
         if other_sv.old_num_merged_svs > 0:
             self.old_num_merged_svs += other_sv.old_num_merged_svs - 1
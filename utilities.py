@@ -1,3 +1,6 @@
+from collections import Counter
+
+
 def calculate_overlap(i1_begin, i1_end, i2_begin, i2_end):
     """
     Calculates percentage of overlapping positions between two internvals, [i1_begin, i1_end[ and [i2_begin, i2_end[.
@@ -58,11 +61,23 @@ assert calculate_mean(range(11)) == 5.0
 
 def calculate_ssd(data):
     """
-    Calculates the sum of square deviation of data.
+    Calculates the sum of square deviation of data. Integer data, such as positions, is handled exactly in a single
+    pass. Other data falls back to summing square deviations from the mean, which avoids cancellation.
     """
-    c = calculate_mean(data)
-    ss = sum((float(x) - c)**2 for x in data)
-    return float(ss)
+    n = len(data)
+    assert n > 0
+    s = 0
+    ss = 0
+
+    for x in data:
+        s += x
+        ss += x * x
+
+    if isinstance(s, int):
+        return float(n * ss - s * s) / float(n)
+
+    c = s / float(n)
+    return float(sum((float(x) - c)**2 for x in data))
 
 
 def calculate_stddev(data, degrees_of_freedom=1.0):
@@ -79,6 +94,16 @@ def calculate_stddev(data, degrees_of_freedom=1.0):
     return pvar ** 0.5
 
 
+# Unit tests for the functions 'calculate_ssd()' and 'calculate_stddev()'
+assert calculate_ssd([5]) == 0.0
+assert calculate_ssd([1, 2, 3, 4]) == 5.0
+assert calculate_ssd([40000000, 40000001]) == 0.5
+assert calculate_stddev([7]) == 0.0
+assert calculate_stddev([2, 4, 4, 4, 5, 5, 7, 9], degrees_of_freedom=0.0) == 2.0
+assert abs(calculate_ssd([0.5, 1.5]) - 0.5) < 1e-12
+assert abs(calculate_stddev([1e9 + 0.1, 1e9 + 0.2, 1e9 + 0.3]) - 0.1) < 1e-6
+
+
 def calculate_stddev_no_outliers(data, degrees_of_freedom=1.0):
     """
     Calculates the population standard deviation of data but ignores outliers
@@ -98,10 +123,10 @@ def calculate_stddev_no_outliers(data, degrees_of_freedom=1.0):
 
 def get_most_common_item(data):
     """
-    Returns the most common item of a list. The list may contain tuples
+    Returns the most common item of a list. The list may contain tuples. Ties are resolved to the item seen first.
     """
     assert isinstance(data, list)
-    return max(set(data), key=data.count)
+    return Counter(data).most_common(1)[0][0]
 
 
 assert get_most_common_item([0]) == 0
@@ -109,3 +134,4 @@ assert get_most_common_item([0, 1, 1]) == 1
 assert get_most_common_item([0, 1, 1, 0, 100, 0]) == 0
 assert get_most_common_item([(0, 1), (0, 2), (0, 2), (0, 3)]) == (0, 2)
 assert get_most_common_item([(0, 1), (0, 2), (0, 2), (0, 3), (0, 1), (0, 1)]) == (0, 1)
+assert get_most_common_item([(0, 3), (0, 1), (0, 2)]) == (0, 3)